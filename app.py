@@ -3,10 +3,6 @@
 import streamlit as st
 import os
 
-# Import utility needed for initialization
-from clip_utils import load_clip
-from pages import Product_Info as product_info, Upload_Photos as upload_photos, Report as report
-
 # ---------------- Session State Initialization ----------------
 if "step" not in st.session_state:
     st.session_state.step = 1
@@ -39,10 +35,17 @@ def main():
         with st.empty():
             st.markdown("<h1 style='text-align: center;'>Resello AI</h1>", unsafe_allow_html=True)
             with st.spinner(""):
+                # Importing here keeps torch/transformers out of module scope;
+                # the import itself builds the cached CLIP singleton
+                from clip_utils import load_clip
                 load_clip()
                 st.session_state.clip_loaded = True
             st.rerun()
 
+    # Page modules pull in torch, transformers and OpenCV; import them only once
+    # CLIP is loaded (Python's module cache makes later reruns a dict lookup)
+    from pages import Product_Info as product_info, Upload_Photos as upload_photos, Report as report
+
     if st.session_state.step == 1:
         product_info.render()
     elif st.session_state.step == 2:
@@ -1,9 +1,17 @@
 """
 CLIP model utilities for image classification and view validation
 """
+import gc
+import os
+from collections import Counter
+
+import numpy as np
 import streamlit as st
 import torch
 from PIL import Image
+from torchvision.io import decode_image, ImageReadMode
+from torchvision.transforms import InterpolationMode
+from torchvision.transforms import v2
 try:
     from transformers import CLIPProcessor, CLIPModel
 except ImportError:
@@ -17,42 +25,174 @@ from config import (
     CLIP_TOP1_TOP2_MARGIN,
     CLIP_EXPECTED_VS_UNRELATED,
     CLIP_MAX_UNRELATED_ALLOWED,
+    CLIP_MODEL_NAME,
+    CLIP_CPU_INT8,
+    PRODUCT_INSPECTION_VIEWS,
     VIEW_REQUIRED_MARGINS,
     CONFIG
 )
 
+# Per-view confidence margin, resolved once: the explicit per-view margin if set,
+# otherwise the margin of the product the view belongs to
+_VIEW_REQUIRED_MARGIN = {
+    view: VIEW_REQUIRED_MARGINS.get(view, CONFIG[product_type]["required_margin"])
+    for product_type, inspection in PRODUCT_INSPECTION_VIEWS.items()
+    for view in inspection["views"]
+}
+
+# Leave cores for Streamlit's own threads (forwards run under torch.inference_mode)
+torch.set_num_threads(max(1, (os.cpu_count() or 2) // 2))
+if torch.cuda.is_available():
+    torch.backends.cudnn.benchmark = True
+
 # ---------------- Load CLIP ----------------
+def _pick_device():
+    """Prefer CUDA, then Apple MPS, then CPU"""
+    if torch.cuda.is_available():
+        return "cuda"
+    if torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
 @st.cache_resource(show_spinner=False)
 def load_clip():
-    """Load and cache CLIP model"""
-    model = CLIPModel.from_pretrained("openai/clip-vit-large-patch14")
+    """Load and cache CLIP model on the best available device (fp16 on GPU, fp32 or opt-in int8 on CPU)"""
+    device = _pick_device()
+    dtype = torch.float16 if device != "cpu" else torch.float32
+    model = CLIPModel.from_pretrained(CLIP_MODEL_NAME, torch_dtype=dtype).to(device)
     processor = CLIPProcessor.from_pretrained(
-        "openai/clip-vit-large-patch14",
+        CLIP_MODEL_NAME,
         use_fast=True
     )
     model.eval()
+
+    if device == "cpu" and CLIP_CPU_INT8:
+        # Dynamic int8 quantization of the Linear layers (VNNI kernels on x86);
+        # GPUs stay on fp16, which is faster there
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    if device == "cuda":
+        # Compile the vision tower (the per-upload hot path) with fused kernels but no
+        # CUDA graphs: their trees are per-thread and their output buffers are reused
+        # on the next replay, which Streamlit's concurrent script threads can't share.
+        # Each batch size is its own compile, so warm up every size a request can send
+        # (1 up to the most views a product has) here rather than on the request path.
+        # CPU (int8) and MPS stay eager: recompiles would cost seconds per batch size.
+        eager_vision = model.vision_model
+        try:
+            model.vision_model = torch.compile(eager_vision, dynamic=False)
+            size = processor.image_processor.crop_size["height"]
+            max_views = max(len(inspection["views"]) for inspection in PRODUCT_INSPECTION_VIEWS.values())
+            with torch.inference_mode():
+                for n in range(1, max_views + 1):
+                    model.vision_model(pixel_values=torch.zeros(n, 3, size, size, dtype=model.dtype, device=device))
+        except Exception:
+            # Older torch or no compiler toolchain available: stay eager
+            model.vision_model = eager_vision
     return model, processor
 
 # Global CLIP model instance
 _clip_model, _clip_processor = load_clip()
+_device = _clip_model.device
+
+def release_memory():
+    """Collect dropped images/tensors and return cached GPU blocks to the driver"""
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+def _encode_text(labels):
+    """Encode text labels into L2-normalized CLIP text features"""
+    inputs = _clip_processor(text=labels, return_tensors="pt", padding=True).to(_device)
+    with torch.inference_mode():
+        features = _clip_model.text_projection(_clip_model.text_model(**inputs).pooler_output)
+    features = features.float()
+    return features / features.norm(p=2, dim=-1, keepdim=True)
+
+# Tensor-native replica of the processor's resize/crop/normalize, so images
+# never round-trip through PIL
+_image_processor = _clip_processor.image_processor
+_clip_transform = v2.Compose([
+    v2.Resize(_image_processor.crop_size["height"], interpolation=InterpolationMode.BICUBIC, antialias=True),
+    v2.CenterCrop(_image_processor.crop_size["height"]),
+    v2.ToDtype(torch.float32, scale=True),
+    v2.Normalize(_image_processor.image_mean, _image_processor.image_std),
+])
+
+def _decode_image(image):
+    """
+    Get a uint8 RGB tensor (C, H, W) for CLIP
+
+    Accepts an already-decoded tensor, RGB (H, W, C) uint8 array or PIL image
+    as-is (no second decode); uploaded files are decoded straight from their
+    JPEG/PNG bytes.
+    """
+    if isinstance(image, torch.Tensor):
+        return image
+    if isinstance(image, np.ndarray):
+        return torch.from_numpy(image).permute(2, 0, 1)
+    if isinstance(image, Image.Image):
+        return v2.functional.pil_to_tensor(image.convert("RGB"))
+    image.seek(0)
+    data = torch.frombuffer(bytearray(image.read()), dtype=torch.uint8)
+    return decode_image(data, mode=ImageReadMode.RGB)
+
+def prepare_clip_input(image):
+    """
+    Resize/crop/normalize one image into CLIP pixel values (3, H, W)
+    
+    Pure tensor work that releases the GIL, so callers can run it on worker
+    threads and hand the result to clip_view_check_batch(prepared=True).
+    """
+    return _clip_transform(_decode_image(image))
+
+def _preprocess_images(images):
+    """Resize/crop/normalize decoded uint8 image tensors into a stacked pixel_values batch"""
+    return torch.stack([_clip_transform(img) for img in images])
+
+def _encode_pixel_values(pixel_values):
+    """Run the vision tower on a pixel_values batch -> L2-normalized image features"""
+    pixel_values = pixel_values.to(_device, dtype=_clip_model.dtype, non_blocking=True)
+    with torch.inference_mode():
+        features = _clip_model.visual_projection(
+            _clip_model.vision_model(pixel_values=pixel_values).pooler_output
+        )
+    features = features.float()
+    return features / features.norm(p=2, dim=-1, keepdim=True)
+
+def _encode_images(images):
+    """Encode a list of decoded image tensors into L2-normalized CLIP image features in one forward"""
+    return _encode_pixel_values(_preprocess_images(images))
+
+# Labels never change, so their text features are encoded once at import
+_logit_scale = _clip_model.logit_scale.detach().exp().float()
+_product_text_features = _encode_text(CLIP_PRODUCT_LABELS)
+_view_text_features = {
+    view: _encode_text(labels) for view, labels in VIEW_CLIP_LABELS.items()
+}
 
 # ---------------- CLIP Core ----------------
-def clip_logits(image, labels):
-    """Compute CLIP logits for image-text pairs"""
-    inputs = _clip_processor(text=labels, images=image, return_tensors="pt", padding=True)
-    with torch.no_grad():
-        outputs = _clip_model(**inputs)
-    logits = outputs.logits_per_image.squeeze(0)
+def clip_logits_image_only(image, text_features):
+    """Compute CLIP logits for one image against pre-encoded text features (returned on CPU)"""
+    logits = (_logit_scale * _encode_images([image]) @ text_features.T).squeeze(0)
     probs = torch.softmax(logits, dim=0)
-    return logits, probs
+    return logits.cpu(), probs.cpu()
 
 # ---------------- CLIP Same-Device Consistency ----------------
+_PRODUCT_REJECT_REASONS = (
+    "predicted Unrelated",
+    "low confidence margin",
+    "high unrelated probability",
+    "selected category not dominant",
+)
+
 def clip_product_check(uploaded_files, selected_category):
     """
     Verify all images belong to the selected product category
     
     Args:
-        uploaded_files: Dict of {view_name: file} uploaded images
+        uploaded_files: Dict of {view_name: image}; each image is an uploaded
+            file, a PIL image or a decoded uint8 tensor
         selected_category: Expected product category ("Laptop" or "Mobile")
     
     Returns:
@@ -61,28 +201,34 @@ def clip_product_check(uploaded_files, selected_category):
     expected_idx = CATEGORY_TO_CLIP_CLASS[selected_category]
     rejected, votes, per_view = [], [], {}
 
-    for view, file in uploaded_files.items():
-        file.seek(0)
-        img = Image.open(file).convert("RGB")
-        logits, probs = clip_logits(img, CLIP_PRODUCT_LABELS)
+    images = [_decode_image(file) for file in uploaded_files.values()]
 
-        top2 = torch.topk(logits, 2)
-        margin = float(top2.values[0] - top2.values[1])
-        top_idx = int(top2.indices[0])
+    # Single batched forward: (N, 3) logits for all views at once
+    logits = _logit_scale * _encode_images(images) @ _product_text_features.T
+    probs = torch.softmax(logits, dim=1)
 
-        reasons = []
-        if CLIP_PRODUCT_CLASS_TO_NAME[top_idx] == "Unrelated":
-            reasons.append("predicted Unrelated")
-        if margin < CLIP_TOP1_TOP2_MARGIN:
-            reasons.append("low confidence margin")
-        if probs[2] > CLIP_MAX_UNRELATED_ALLOWED:
-            reasons.append("high unrelated probability")
-        if (logits[expected_idx] - logits[2]) < CLIP_EXPECTED_VS_UNRELATED:
-            reasons.append("selected category not dominant")
+    # Evaluate every rejection rule for all views on-device, then sync once
+    top2_vals, top2_idx = logits.topk(2, dim=1)
+    margins = top2_vals[:, 0] - top2_vals[:, 1]
+    top_idx = top2_idx[:, 0]
+    reasons_mask = torch.stack([
+        top_idx == 2,
+        margins < CLIP_TOP1_TOP2_MARGIN,
+        probs[:, 2] > CLIP_MAX_UNRELATED_ALLOWED,
+        (logits[:, expected_idx] - logits[:, 2]) < CLIP_EXPECTED_VS_UNRELATED,
+    ], dim=1)
+    top_probs = probs.gather(1, top_idx[:, None])
+    rows = torch.cat(
+        [top_idx[:, None].float(), top_probs, margins[:, None], reasons_mask.float()], dim=1
+    ).cpu().tolist()
+
+    for view, (top, prob, margin, *mask) in zip(uploaded_files, rows):
+        top = int(top)
+        reasons = [label for label, hit in zip(_PRODUCT_REJECT_REASONS, mask) if hit]
 
         per_view[view] = {
-            "top": CLIP_PRODUCT_CLASS_TO_NAME[top_idx],
-            "prob": float(probs[top_idx]),
+            "top": CLIP_PRODUCT_CLASS_TO_NAME[top],
+            "prob": prob,
             "margin": margin,
             "reasons": reasons
         }
@@ -90,60 +236,74 @@ def clip_product_check(uploaded_files, selected_category):
         if reasons:
             rejected.append(view)
         else:
-            votes.append(top_idx)
+            votes.append(top)
 
     if rejected:
         return False, "Unrelated / wrong product images", per_view
 
-    majority = max(set(votes), key=votes.count)
+    majority = Counter(votes).most_common(1)[0][0] if votes else expected_idx
     return majority == expected_idx, CLIP_PRODUCT_CLASS_TO_NAME[majority], per_view
 
-def clip_view_check(image_file, view_name):
+def clip_view_check(image, view_name):
     """
     Validate that an image matches the expected view
     
     Args:
-        image_file: Uploaded image file
+        image: Uploaded image file, PIL image, RGB uint8 array or decoded uint8 tensor
         view_name: Expected view name
     
     Returns:
         Tuple of (is_valid, reasons_list, info_dict)
     """
-    image_file.seek(0)
-    labels = VIEW_CLIP_LABELS.get(view_name)
-    if labels is None:
-        return True, [], {}
+    return clip_view_check_batch([image], [view_name])[0]
 
-    img = Image.open(image_file).convert("RGB")
-    logits, probs = clip_logits(img, labels)
-
-    top2 = torch.topk(logits, 2)
-    margin = float(top2.values[0] - top2.values[1])
-    top_idx = int(top2.indices[0])
+def clip_view_check_batch(images, view_names, prepared=False):
+    """
+    Validate several images against their expected views with one CLIP forward
     
-    # Determine product type from view name
-    product_type = "Laptop"
-    for mobile_view in ["Front screen", "Back panel", "Left side (buttons)", 
-                        "Right side (buttons)", "Bottom edge (charging port)", "Camera close-up"]:
-        if view_name == mobile_view:
-            product_type = "Mobile"
-            break
-            
-    REQUIRED_MARGIN = VIEW_REQUIRED_MARGINS.get(
-        view_name,
-        CONFIG[product_type]["required_margin"]
-    )
-
-    reasons = []
-    if top_idx != 0:
-        reasons.append(f"Matching failed: {labels[top_idx]}")
-    if margin < REQUIRED_MARGIN:
-        reasons.append(f"Image not clear enough (Confidence margin: {margin:.2f})")
+    Args:
+        images: List of images (any type clip_view_check accepts), or their
+            prepare_clip_input outputs when prepared is True
+        view_names: Expected view name for each image
+        prepared: Whether images are already CLIP pixel values
     
-    info = {
-        "predicted": labels[top_idx],
-        "prob": float(probs[top_idx]),
-        "margin": margin
-    }
+    Returns:
+        List of (is_valid, reasons_list, info_dict), one per image
+    """
+    results = [(True, [], {}) for _ in images]
+    checked = [i for i, view in enumerate(view_names) if view in VIEW_CLIP_LABELS]
+    if not checked:
+        return results
+
+    # Each view has its own label set, so only the image encoding is shared
+    if prepared:
+        features = _encode_pixel_values(torch.stack([images[i] for i in checked]))
+    else:
+        features = _encode_images([_decode_image(images[i]) for i in checked])
+
+    for i, feat in zip(checked, features):
+        view_name = view_names[i]
+        labels = VIEW_CLIP_LABELS[view_name]
+        logits = (_logit_scale * feat @ _view_text_features[view_name].T).cpu()
+        probs = torch.softmax(logits, dim=0)
+
+        top2 = torch.topk(logits, 2)
+        margin = float(top2.values[0] - top2.values[1])
+        top_idx = int(top2.indices[0])
+        
+        REQUIRED_MARGIN = _VIEW_REQUIRED_MARGIN.get(view_name, CONFIG["Laptop"]["required_margin"])
+
+        reasons = []
+        if top_idx != 0:
+            reasons.append(f"Matching failed: {labels[top_idx]}")
+        if margin < REQUIRED_MARGIN:
+            reasons.append(f"Image not clear enough (Confidence margin: {margin:.2f})")
+        
+        info = {
+            "predicted": labels[top_idx],
+            "prob": float(probs[top_idx]),
+            "margin": margin
+        }
+        results[i] = (len(reasons) == 0, reasons, info)
 
-    return len(reasons) == 0, reasons, info
+    return results
@@ -1,6 +1,7 @@
 """
 Configuration constants for Re-Commerce AI Inspector
 """
+import os
 
 # ---------------- Product Inspection Configuration ----------------
 PRODUCT_INSPECTION_VIEWS = {
@@ -33,12 +34,17 @@ CONFIG = {
     "Laptop": {
         "min_width": 800,
         "min_height": 600,
-        "required_margin": 0.6
+        "required_margin": 0.6,
+        # Laplacian variance: below blur_severe rejects, below blur_borderline warns
+        "blur_severe": 30,
+        "blur_borderline": 45
     },
     "Mobile": {
         "min_width": 400,
         "min_height": 300,
-        "required_margin": 0.3
+        "required_margin": 0.3,
+        "blur_severe": 12,
+        "blur_borderline": 18
     }
 }
 
@@ -62,6 +68,15 @@ VIEW_REQUIRED_MARGINS = {
     "Camera close-up": 0.20,
 }
 
+# ---------------- CLIP Model ----------------
+# The margins below were tuned on ViT-L/14 logits, so it stays the default. A smaller
+# checkpoint (e.g. openai/clip-vit-base-patch16, or a local path) can be set through
+# CLIP_MODEL_NAME, but recalibrate the margins on test_images/ before switching.
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "openai/clip-vit-large-patch14")
+# Dynamic int8 quantization of CLIP's Linear layers on CPU. Off by default: the margins
+# have not been re-verified on the quantized model's logits
+CLIP_CPU_INT8 = os.getenv("CLIP_CPU_INT8", "0") == "1"
+
 # ---------------- CLIP Thresholds ----------------
 CLIP_TOP1_TOP2_MARGIN = 1.5
 CLIP_EXPECTED_VS_UNRELATED = 1.0
@@ -140,3 +155,30 @@ VIEW_CLIP_LABELS = {
         "a photo of an unrelated object"
     ]
 }
+
+# ---------------- Gemini Configuration ----------------
+# Maximum number of concurrent per-view Gemini damage requests
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+# Longest side (px) of images sent to Gemini; it tiles inputs internally, so larger only costs bandwidth and tokens
+GEMINI_MAX_SIDE = int(os.getenv("GEMINI_MAX_SIDE", "1568"))
+# On-disk memo of Gemini analysis results, keyed by image hash + view + product type
+GEMINI_CACHE_PATH = os.getenv("GEMINI_CACHE_PATH", os.path.join(".resello_cache", "llm_cache.json"))
+# Entries older than GEMINI_CACHE_TTL seconds are re-asked; beyond GEMINI_CACHE_MAX the least recently used go
+GEMINI_CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", str(7 * 24 * 3600)))
+GEMINI_CACHE_MAX = int(os.getenv("GEMINI_CACHE_MAX", "2000"))
+# Comma-separated Gemini keys the pricing report rotates across (falls back to the session key if empty)
+GEMINI_KEYS = [k.strip() for k in os.getenv("GEMINI_KEYS", "").split(",") if k.strip()]
+# Submit the AI pricing report through the Gemini Batch API (cheaper, but takes minutes)
+GEMINI_BATCH_REPORTS = os.getenv("GEMINI_BATCH_REPORTS", "0") == "1"
+# Skip Gemini damage analysis for a view that looks pristine: few Canny edges and a confident CLIP view match.
+# Off by default: the thresholds are not yet calibrated against labelled clean/damaged photos, and a
+# false "pristine" silently inflates the price
+PRISTINE_SKIP_ENABLED = os.getenv("PRISTINE_SKIP_ENABLED", "0") == "1"
+PRISTINE_MAX_EDGE_DENSITY = float(os.getenv("PRISTINE_MAX_EDGE_DENSITY", "0.02"))
+PRISTINE_MIN_VIEW_PROB = float(os.getenv("PRISTINE_MIN_VIEW_PROB", "0.9"))
+
+# ---------------- Price Search Configuration ----------------
+# On-disk cache of SerpAPI price reports keyed by brand|model, shared across sessions
+PRICE_CACHE_PATH = os.getenv("PRICE_CACHE_PATH", os.path.join(".resello_cache", "prices.json"))
+PRICE_CACHE_TTL = int(os.getenv("PRICE_CACHE_TTL", str(24 * 3600)))
+PRICE_CACHE_MAX = int(os.getenv("PRICE_CACHE_MAX", "1000"))
@@ -3,32 +3,236 @@ Gemini API utilities for damage analysis and report generation
 """
 import streamlit as st
 import google.generativeai as genai
+import asyncio
+import copy
+import threading
 import json
 import base64
+import functools
+import hashlib
+import itertools
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
-import re
+from PIL import Image
+from google.api_core.exceptions import ResourceExhausted
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+from config import GEMINI_CACHE_MAX, GEMINI_CACHE_PATH, GEMINI_CACHE_TTL, GEMINI_KEYS, GEMINI_MAX_SIDE
+
+try:
+    # orjson parses Gemini replies several times faster; stdlib json is the fallback
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    # google-genai: only needed for the optional Batch API report path
+    from google import genai as genai_client
+except Exception:
+    genai_client = None
+
+GEMINI_MODEL = "gemini-2.5-flash"
 
 # ---------------- Gemini Configuration ----------------
+_configured_key = None
+
+@functools.lru_cache(maxsize=4)
+def _get_model(name):
+    """Shared GenerativeModel per model name, so its client and connections are reused"""
+    return genai.GenerativeModel(name)
+
+def _configure(api_key):
+    """Point genai at api_key; cached models hold the previous key's client, so drop them on change"""
+    global _configured_key
+    if api_key != _configured_key:
+        genai.configure(api_key=api_key)
+        _get_model.cache_clear()
+        _configured_key = api_key
+
 def initialize_gemini(api_key):
     """Initialize Gemini API with user's API key"""
     try:
-        genai.configure(api_key=api_key)
+        _configure(api_key)
         return True
     except Exception as e:
         st.error(f"Failed to initialize Gemini: {str(e)}")
         return False
 
-def image_to_base64(image):
-    """Convert PIL Image to base64 for Gemini"""
+# ---------------- Response Schemas ----------------
+# Passed as response_schema so Gemini returns bare, parseable JSON (no fences or preamble)
+_ISSUE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "type": {"type": "string"},
+        "severity": {"type": "string"},
+        "location": {"type": "string"},
+        "description": {"type": "string"},
+    },
+    "required": ["type", "severity", "location", "description"],
+}
+
+DAMAGE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "issues": {"type": "array", "items": _ISSUE_SCHEMA},
+        "overall_condition": {"type": "string"},
+    },
+    "required": ["issues", "overall_condition"],
+}
+
+_SAME_DEVICE_PROPERTIES = {
+    "same_device": {"type": "boolean"},
+    "confidence": {"type": "string", "enum": ["high", "medium", "low"]},
+    "reason": {"type": "string"},
+}
+
+SAME_DEVICE_SCHEMA = {
+    "type": "object",
+    "properties": _SAME_DEVICE_PROPERTIES,
+    "required": ["same_device", "confidence", "reason"],
+}
+
+COMBINED_SCHEMA = {
+    "type": "object",
+    "properties": {
+        **_SAME_DEVICE_PROPERTIES,
+        "views": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"view": {"type": "string"}, **DAMAGE_SCHEMA["properties"]},
+                "required": ["view", "issues", "overall_condition"],
+            },
+        },
+    },
+    "required": ["same_device", "confidence", "reason", "views"],
+}
+
+def _json_config(schema):
+    """generation_config asking Gemini for JSON matching schema"""
+    return {"response_mime_type": "application/json", "response_schema": schema}
+
+def run_async(coro):
+    """
+    Run a Gemini coroutine to completion on a fresh event loop in the calling thread
+    
+    Requests go through genai's thread-safe sync client via asyncio.to_thread, so
+    nothing is bound to a particular loop and sessions never wait on each other.
+    The loop runs on the calling (script) thread, so st.* calls inside work.
+    """
+    return asyncio.run(coro)
+
+# ---------------- Result Cache ----------------
+_cache_lock = threading.Lock()
+# One background writer, so puts made inside coroutines never block on file I/O
+_disk_writer = ThreadPoolExecutor(1)
+_flush_pending = False
+
+def _load_disk_cache():
+    """Load unexpired persisted Gemini results, oldest first; a missing or corrupt file starts empty"""
+    try:
+        with open(GEMINI_CACHE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return OrderedDict()
+    now = time.time()
+    fresh = [
+        (key, entry) for key, entry in data.items()
+        if isinstance(entry, list) and len(entry) == 2 and now - entry[0] < GEMINI_CACHE_TTL
+    ]
+    fresh.sort(key=lambda item: item[1][0])
+    return OrderedDict((key, tuple(entry)) for key, entry in fresh[-GEMINI_CACHE_MAX:])
+
+# {key: (timestamp, result)} LRU shared by every session in the process
+_disk_cache = _load_disk_cache()
+
+def _image_digest(image):
+    """Short sha256 of a PIL image's decoded pixels (mode and size included)"""
+    h = hashlib.sha256(f"{image.mode}{image.size}".encode())
+    h.update(image.tobytes())
+    return h.hexdigest()[:16]
+
+def _cache_get(key):
+    """Look up key in the session memo, then the shared cache (as a copy, never a shared dict)"""
+    memo = st.session_state.setdefault("_gemini_cache", {})
+    if key not in memo:
+        with _cache_lock:
+            hit = _disk_cache.get(key)
+            if hit is None:
+                return None
+            if time.time() - hit[0] >= GEMINI_CACHE_TTL:
+                del _disk_cache[key]
+                return None
+            _disk_cache.move_to_end(key)
+            memo[key] = copy.deepcopy(hit[1])
+    return memo[key]
+
+def _cache_put(key, value):
+    """Store value in the session memo and the bounded shared cache, and schedule a disk write"""
+    global _flush_pending
+    st.session_state.setdefault("_gemini_cache", {})[key] = value
+    now = time.time()
+    with _cache_lock:
+        _disk_cache[key] = (now, copy.deepcopy(value))
+        _disk_cache.move_to_end(key)
+        while _disk_cache and now - next(iter(_disk_cache.values()))[0] >= GEMINI_CACHE_TTL:
+            _disk_cache.popitem(last=False)
+        while len(_disk_cache) > GEMINI_CACHE_MAX:
+            _disk_cache.popitem(last=False)
+        if _flush_pending:
+            return
+        _flush_pending = True
+    _disk_writer.submit(_flush_disk_cache)
+
+def _flush_disk_cache():
+    """Write a snapshot of the shared cache; puts arriving meanwhile share the next write"""
+    global _flush_pending
+    with _cache_lock:
+        _flush_pending = False
+        snapshot = {key: list(entry) for key, entry in _disk_cache.items()}
+    try:
+        os.makedirs(os.path.dirname(GEMINI_CACHE_PATH) or ".", exist_ok=True)
+        tmp = GEMINI_CACHE_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f)
+        os.replace(tmp, GEMINI_CACHE_PATH)
+    except OSError:
+        pass
+
+def _prepare_for_gemini(image):
+    """
+    Downscale and re-encode a PIL Image as a JPEG blob for upload
+    
+    genai serializes bare PIL images as lossless WebP, which is slow to encode and
+    several MB per photo. A capped-size quality-85 JPEG (EXIF dropped, since it is
+    not copied on save) is a fraction of that.
+    
+    Returns:
+        Dict with keys: mime_type, data (accepted by generate_content as an image part)
+    """
+    if max(image.size) > GEMINI_MAX_SIDE:
+        image = image.copy()
+        image.thumbnail((GEMINI_MAX_SIDE, GEMINI_MAX_SIDE), Image.LANCZOS)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
     buffered = BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode()
+    image.save(buffered, format="JPEG", quality=85)
+    return {"mime_type": "image/jpeg", "data": buffered.getvalue()}
+
+def image_to_base64(image):
+    """Convert PIL Image to base64 (downscaled JPEG) for Gemini"""
+    return base64.b64encode(_prepare_for_gemini(image)["data"]).decode()
 
 # ---------------- Gemini Validation Analysis ----------------
 def verify_same_device_with_gemini(images, product_type):
     """
     Verify whether multiple photos belong to the same physical device
     
+    Only "same device" verdicts are cached; a "no" is asked again next time.
+    
     Args:
         images: List of PIL Images
         product_type: "Laptop" or "Mobile"
@@ -36,7 +240,12 @@ def verify_same_device_with_gemini(images, product_type):
     Returns:
         Dict with keys: same_device (bool), confidence (str), reason (str)
     """
-    model = genai.GenerativeModel("gemini-2.5-flash")
+    key = "same|" + ",".join(sorted(_image_digest(img) for img in images)) + "|" + product_type
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    model = _get_model(GEMINI_MODEL)
 
     prompt = f"""
 You are verifying whether multiple photos belong to the SAME physical {product_type}.
@@ -62,34 +271,20 @@ Return ONLY valid JSON:
 }}
 """
 
-    response = model.generate_content([prompt] + images)
-
-    text = response.text.strip()
-    if text.startswith("```"):
-        text = text.strip("```").replace("json", "").strip()
+    response = model.generate_content(
+        [prompt] + [_prepare_for_gemini(img) for img in images],
+        generation_config=_json_config(SAME_DEVICE_SCHEMA),
+    )
 
-    return json.loads(text)
+    result = _json_loads(response.text)
+    # A "no" is the prompt's answer to any doubt, so it is re-asked rather than pinned
+    if result.get("same_device"):
+        _cache_put(key, result)
+    return result
 
 
 # ---------------- Gemini Damage Analysis ----------------
-def analyze_damage_with_gemini(image, view_name, product_type):
-    """
-    Use Gemini 2.5 Flash to detect scratches and damage
-    
-    Args:
-        image: PIL Image
-        view_name: Name of the view being analyzed
-        product_type: "Laptop" or "Mobile"
-    
-    Returns:
-        Dict with keys: issues (list), overall_condition (str)
-    """
-    try:
-        model = genai.GenerativeModel('gemini-2.5-flash')
-        
-        prompt = f"""Analyze this {product_type} image showing the '{view_name}' view for physical damage and wear.
-
-CRITICAL INSTRUCTIONS - BE EXTREMELY CAREFUL:
+_DAMAGE_CRITERIA = """CRITICAL INSTRUCTIONS - BE EXTREMELY CAREFUL:
 - Only report damage that is CLEARLY and UNMISTAKABLY VISIBLE
 - Do NOT confuse reflections, lighting, shadows, or glare with damage
 - Glass/reflective surfaces often show reflections that look like cracks - IGNORE THESE
@@ -105,7 +300,41 @@ Identify ONLY if you are absolutely certain:
 5. **Wear**: Obvious usage wear like paint loss or material degradation
 6. **Broken Parts**: Missing or broken components
 
-If the condition appears good or you're unsure, respond with pristine condition.
+If the condition appears good or you're unsure, respond with pristine condition."""
+
+async def analyze_damage_with_gemini(image, view_name, product_type):
+    """
+    Use Gemini 2.5 Flash to detect scratches and damage
+    
+    Results are memoized by image hash + view + product type, so re-analyzing
+    unchanged photos skips the network call. Failed ("unknown") results are not cached.
+    
+    Args:
+        image: PIL Image
+        view_name: Name of the view being analyzed
+        product_type: "Laptop" or "Mobile"
+    
+    Returns:
+        Dict with keys: issues (list), overall_condition (str)
+    """
+    key = _image_digest(image) + "|" + view_name + "|" + product_type
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+
+    result = await _analyze_damage_uncached(image, view_name, product_type)
+    if result["overall_condition"] != "unknown":
+        _cache_put(key, result)
+    return result
+
+async def _analyze_damage_uncached(image, view_name, product_type):
+    """Single Gemini damage-analysis request for one view"""
+    try:
+        model = _get_model(GEMINI_MODEL)
+        
+        prompt = f"""Analyze this {product_type} image showing the '{view_name}' view for physical damage and wear.
+
+{_DAMAGE_CRITERIA}
 
 IMPORTANT: Return ONLY valid JSON, no markdown code blocks, no extra text:
 {{
@@ -121,27 +350,13 @@ If pristine:
   "overall_condition": "pristine"
 }}"""
 
-        response = model.generate_content([prompt, image])
-        
-        # Parse JSON response with better error handling
-        text = response.text.strip()
-        
-        # Remove markdown code blocks
-        # Try to extract JSON from markdown blocks
-        json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', text, re.DOTALL)
-        if json_match:
-            text = json_match.group(1)
-        else:
-            # Remove any leading/trailing markdown
-            text = re.sub(r'^```(?:json)?\s*', '', text)
-            text = re.sub(r'\s*```$', '', text)
+        response = await asyncio.to_thread(
+            model.generate_content,
+            [prompt, _prepare_for_gemini(image)],
+            generation_config=_json_config(DAMAGE_SCHEMA),
+        )
         
-        # Try to find JSON object even if embedded in text
-        json_match = re.search(r'\{.*\}', text, re.DOTALL)
-        if json_match:
-            text = json_match.group(0)
-        
-        result = json.loads(text.strip())
+        result = _json_loads(response.text)
         
         # Validate the result structure
         if "issues" not in result or "overall_condition" not in result:
@@ -168,6 +383,104 @@ If pristine:
             "overall_condition": "unknown"
         }
 
+# ---------------- Gemini Combined Analysis ----------------
+async def analyze_all_views_with_gemini(images_by_view, product_type, damage_views=None):
+    """
+    Same-device verification and per-view damage analysis in a single Gemini request
+    
+    Replaces one verify_same_device_with_gemini call plus N analyze_damage_with_gemini
+    calls with one multimodal prompt. Results are cached under the same keys as the
+    single-call helpers; if everything is cached no request is made.
+    
+    Args:
+        images_by_view: Dict of {view_name: PIL Image}
+        product_type: "Laptop" or "Mobile"
+        damage_views: Views to analyze for damage (default all); every image is
+            still sent for the identity check
+    
+    Returns:
+        Tuple (same_device_result, analysis_results). analysis_results covers only
+        damage_views and may be missing views Gemini did not answer for; run
+        analyze_damage_with_gemini on those.
+    """
+    views = list(images_by_view)
+    damage_views = views if damage_views is None else [v for v in views if v in damage_views]
+    digests = {view: _image_digest(img) for view, img in images_by_view.items()}
+    same_key = "same|" + ",".join(sorted(digests.values())) + "|" + product_type
+    view_keys = {view: digests[view] + "|" + view + "|" + product_type for view in views}
+
+    same_device_result = _cache_get(same_key)
+    analysis_results = {}
+    for view in damage_views:
+        cached = _cache_get(view_keys[view])
+        if cached is not None:
+            analysis_results[view] = cached
+    if same_device_result is not None and len(analysis_results) == len(damage_views):
+        return same_device_result, analysis_results
+
+    labels = "\n".join(f"- VIEW_{i}: {view}" for i, view in enumerate(views, start=1))
+    damage_labels = ", ".join(f"VIEW_{i}" for i, view in enumerate(views, start=1) if view in damage_views)
+    prompt = f"""You are inspecting {len(views)} photos of a {product_type} for a re-commerce platform.
+Each image is preceded by its label:
+{labels}
+
+TASK 1 - IDENTITY: Determine whether ALL images show the SAME SINGLE physical device,
+not just the same model or type. Check matching scratches, dents, wear patterns, logos,
+stickers, port wear, color tone and material. If there is ANY doubt, answer false.
+
+TASK 2 - DAMAGE: For each of {damage_labels or "none of the images"}, analyze physical damage and wear.
+
+{_DAMAGE_CRITERIA}
+
+IMPORTANT: Return ONLY valid JSON, no markdown code blocks, no extra text.
+"views" must contain exactly one entry per TASK 2 label, in label order (empty if none):
+{{
+  "same_device": true,
+  "confidence": "high | medium | low",
+  "reason": "brief explanation",
+  "views": [
+    {{"view": "VIEW_1", "issues": [{{"type": "scratches", "severity": "medium", "location": "top-left corner", "description": "visible surface scratches"}}], "overall_condition": "good"}},
+    {{"view": "VIEW_2", "issues": [], "overall_condition": "pristine"}}
+  ]
+}}"""
+
+    contents = [prompt]
+    for i, view in enumerate(views, start=1):
+        contents += [f"VIEW_{i}: {view}", _prepare_for_gemini(images_by_view[view])]
+
+    try:
+        response = await asyncio.to_thread(
+            _get_model(GEMINI_MODEL).generate_content,
+            contents, generation_config=_json_config(COMBINED_SCHEMA)
+        )
+        result = _json_loads(response.text)
+    except Exception as e:
+        st.warning(f"⚠️ Combined Gemini analysis failed, falling back to per-view calls: {str(e)}")
+        if same_device_result is None:
+            same_device_result = verify_same_device_with_gemini(list(images_by_view.values()), product_type)
+        return same_device_result, analysis_results
+
+    if same_device_result is None:
+        same_device_result = {
+            "same_device": bool(result.get("same_device", False)),
+            "confidence": result.get("confidence", "low"),
+            "reason": result.get("reason", ""),
+        }
+        if same_device_result["same_device"]:
+            _cache_put(same_key, same_device_result)
+
+    for i, entry in enumerate(result.get("views", []), start=1):
+        if not isinstance(entry, dict) or "issues" not in entry or "overall_condition" not in entry:
+            continue
+        label = str(entry.get("view", f"VIEW_{i}"))
+        idx = int(label[5:]) - 1 if label.startswith("VIEW_") and label[5:].isdigit() else i - 1
+        if 0 <= idx < len(views) and views[idx] in damage_views and views[idx] not in analysis_results:
+            view = views[idx]
+            analysis_results[view] = {"issues": entry["issues"], "overall_condition": entry["overall_condition"]}
+            _cache_put(view_keys[view], analysis_results[view])
+
+    return same_device_result, analysis_results
+
 # ---------------- Gemini Report Generation ----------------
 def generate_report_with_gemini(analysis_results, product_name, product_type, usage_years):
     """
@@ -183,7 +496,7 @@ def generate_report_with_gemini(analysis_results, product_name, product_type, us
         String containing the generated report
     """
     try:
-        model = genai.GenerativeModel("gemini-2.5-flash")
+        model = _get_model(GEMINI_MODEL)
 
         # Build an issues summary for the prompt
         issues_lines = []
@@ -231,29 +544,22 @@ Return the answer as plain text (no JSON required)."""
         return f"Gemini Error: {str(e)}"
 
 # ---------------- Gemini AI Price Report ----------------
-def generate_ai_price_report(product_name, product_type, usage_years, price_calc_results, special_api_key=None):
-    """
-    Use Gemini 1.5 Flash to generate a professional pricing summary using a custom API key
-    """
-    try:
-        # If a special key is provided, reconfigure temporarily
-        if special_api_key:
-            genai.configure(api_key=special_api_key)
-            
-        model = genai.GenerativeModel("gemini-2.5-flash")
-        
-        base_price = price_calc_results["base_price"]
-        final_price = price_calc_results["final_price"]
-        age_rate = price_calc_results["age_depreciation"]["rate"] * 100
-        defect_rate = price_calc_results["defect_depreciation"]["rate"] * 100
+def _price_report_prompt(product_name, product_type, usage_years, price_calc_results, condition_summary=None):
+    """Build the bilingual pricing-report prompt shared by the sync and batch paths"""
+    base_price = price_calc_results["base_price"]
+    final_price = price_calc_results["final_price"]
+    age_rate = price_calc_results["age_depreciation"]["rate"] * 100
+    defect_rate = price_calc_results["defect_depreciation"]["rate"] * 100
+    
+    issues_summary = []
+    for issue in price_calc_results["defect_depreciation"]["breakdown"]:
+        issues_summary.append(f"- {issue['type']} ({issue['severity']}): {issue['description']}")
         
-        issues_summary = []
-        for issue in price_calc_results["defect_depreciation"]["breakdown"]:
-            issues_summary.append(f"- {issue['type']} ({issue['severity']}): {issue['description']}")
-            
-        issues_text = "\n".join(issues_summary) if issues_summary else "No major physical defects detected."
+    issues_text = "\n".join(issues_summary) if issues_summary else "No major physical defects detected."
+    if condition_summary:
+        issues_text += f"\n\n### INSPECTOR CONDITION SUMMARY:\n{condition_summary}"
 
-        prompt = f"""
+    prompt = f"""
 You are a senior professional physical condition inspector and pricing expert for a high-end re-commerce platform named "Resello".
 Your task is to write a final, polished, and persuasive report for a seller based on our AI inspection and market analysis.
 
@@ -289,9 +595,120 @@ Use the following markers to separate them:
 
 Use professional markdown formatting with clear headings. Use emojis sparingly but effectively.
 """
-
-        response = model.generate_content([prompt])
-        return response.text.strip()
+    return prompt
+
+# ---------------- Report Clients ----------------
+_rr_counter = itertools.count()
+
+@functools.lru_cache(maxsize=1)
+def _report_clients():
+    """One persistent google-genai Client per GEMINI_KEYS entry (empty if unset or SDK missing)"""
+    if genai_client is None:
+        return ()
+    return tuple(genai_client.Client(api_key=k) for k in GEMINI_KEYS)
+
+def _pick_client():
+    """Round-robin over the report clients, or None to use the session's configured key"""
+    clients = _report_clients()
+    if not clients:
+        return None
+    return clients[next(_rr_counter) % len(clients)]
+
+def _is_rate_limited(exc):
+    """True for a 429 / quota error from either Gemini SDK"""
+    return isinstance(exc, ResourceExhausted) or getattr(exc, "code", None) == 429
+
+# Each retry re-picks a client, so a rate-limited key hands off to the next one
+_retry_on_429 = retry(
+    wait=wait_exponential(multiplier=1, max=30),
+    stop=stop_after_attempt(5),
+    retry=retry_if_exception(_is_rate_limited),
+    reraise=True,
+)
+
+@_retry_on_429
+def _open_report_stream(prompt):
+    """Start a streamed report completion; returns the chunk texts with the first one already fetched"""
+    client = _pick_client()
+    if client is None:
+        chunks = iter(_get_model(GEMINI_MODEL).generate_content([prompt], stream=True))
+    else:
+        chunks = iter(client.models.generate_content_stream(model=GEMINI_MODEL, contents=prompt))
+    # Rate-limit errors surface on the first chunk, so pull it inside the retry
+    first = next(chunks, None)
+    head = [] if first is None else [first]
+    return (chunk.text for chunk in itertools.chain(head, chunks))
+
+def stream_ai_price_report(product_name, product_type, usage_years, price_calc_results, condition_summary=None, status=None):
+    """
+    Use Gemini 2.5 Flash to stream a professional pricing summary for st.write_stream
+    
+    Requests rotate across the GEMINI_KEYS clients (the session key if unset) with
+    exponential backoff on rate limits.
+    
+    Args:
+        status: Optional dict; status["ok"] is set to True only once the whole
+            report has streamed, so callers can tell a truncated report apart
+    
+    Yields:
+        Text chunks as Gemini produces them
+    """
+    try:
+        prompt = _price_report_prompt(product_name, product_type, usage_years, price_calc_results, condition_summary)
+        for text in _open_report_stream(prompt):
+            if text:
+                yield text
     except Exception as e:
-        return f"Error generating AI report: {str(e)}"
-
+        yield f"Error generating AI report: {str(e)}"
+        return
+    if status is not None:
+        status["ok"] = True
+
+# ---------------- Gemini Batch Reports ----------------
+_BATCH_DONE_STATES = ("JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED")
+
+def _batch_client():
+    """Batch jobs are owned by the key that created them, so always use the first GEMINI_KEYS client"""
+    clients = _report_clients()
+    if not clients:
+        raise RuntimeError("google-genai and GEMINI_KEYS are required for batch reports")
+    return clients[0]
+
+def submit_batch_report(prompts):
+    """
+    Submit report prompts as one Gemini Batch API job (half the per-request cost)
+    
+    Args:
+        prompts: List of prompt strings
+    
+    Returns:
+        Batch job name to poll with get_batch_status
+    """
+    job = _batch_client().batches.create(
+        model=f"models/{GEMINI_MODEL}",
+        src=[{"contents": [{"parts": [{"text": p}], "role": "user"}]} for p in prompts],
+        config={"display_name": "resello-reports"},
+    )
+    return job.name
+
+def get_batch_status(job_name):
+    """
+    Poll a batch job submitted by submit_batch_report
+    
+    Returns:
+        Tuple (state, texts). texts is None until the job has finished, then a list with
+        one string per prompt (an error message in place of any failed item).
+    """
+    job = _batch_client().batches.get(name=job_name)
+    state = job.state.name
+    if state not in _BATCH_DONE_STATES:
+        return state, None
+    if state != "JOB_STATE_SUCCEEDED":
+        return state, [f"Error generating AI report: batch job ended with {state}"]
+
+    texts = []
+    for item in job.dest.inlined_responses:
+        # A safety-blocked item has a response whose .text is None
+        text = (item.response.text or "").strip() if item.response is not None else ""
+        texts.append(text or f"Error generating AI report: {item.error or 'empty response'}")
+    return state, texts
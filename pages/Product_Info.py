@@ -3,7 +3,7 @@ Page 1: Product Information & API Setup
 """
 import streamlit as st
 from gemini_utils import initialize_gemini
-from validation_helpers import get_inspection_views
+from validation_helpers import get_inspection_views, release_inspection_state
 
 def render():
     st.title("🔍 Resello AI Inspector")
@@ -36,7 +36,7 @@ def render():
         if st.button("Clear & Reset", use_container_width=True):
             st.session_state.product_name = ""
             st.session_state.usage_years = 0.0
-            st.session_state.uploaded_files = {}
+            release_inspection_state()
             st.rerun()
 
     with b_col2:
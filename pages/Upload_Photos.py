@@ -1,11 +1,84 @@
 """
 Page 2: Upload Product Photos & Validation
 """
+import asyncio
 import streamlit as st
+from io import BytesIO
 from PIL import Image
-from validation_helpers import get_file_bytes, get_cached_validation, find_duplicates
+from validation_helpers import (
+    get_file_bytes, get_cached_validation, validate_all, content_digest,
+    compute_dhash, find_duplicates, release_inspection_state,
+)
 from clip_utils import clip_product_check
-from gemini_utils import verify_same_device_with_gemini, analyze_damage_with_gemini
+from gemini_utils import analyze_all_views_with_gemini, analyze_damage_with_gemini, run_async
+from config import (
+    GEMINI_MAX_CONCURRENCY, GEMINI_MAX_SIDE,
+    PRISTINE_SKIP_ENABLED, PRISTINE_MAX_EDGE_DENSITY, PRISTINE_MIN_VIEW_PROB,
+)
+
+def _decode_for_analysis(image_file):
+    """
+    Decode an upload once, capped at GEMINI_MAX_SIDE on the longest side
+    
+    JPEGs use draft mode so the decoder itself works at a reduced DCT scale.
+    """
+    img = Image.open(image_file)
+    scale = GEMINI_MAX_SIDE / max(img.size)
+    if scale < 1:
+        img.draft("RGB", (int(img.width * scale), int(img.height * scale)))
+    img = img.convert("RGB")
+    img.thumbnail((GEMINI_MAX_SIDE, GEMINI_MAX_SIDE), Image.LANCZOS)
+    return img
+
+def _upload_entry(view, uploaded_file):
+    """Session entry for an upload, read and decoded once; reruns reuse it until the file changes"""
+    entry = st.session_state.uploaded_files.get(view)
+    if not entry or entry["id"] != uploaded_file.file_id:
+        b = get_file_bytes(uploaded_file)
+        pil = _decode_for_analysis(BytesIO(b))
+        entry = {
+            "id": uploaded_file.file_id,
+            "name": uploaded_file.name,
+            "bytes": b,
+            "digest": content_digest(b),
+            "pil": pil,
+            # Hashed once per file; duplicate checks on later clicks reuse it
+            "dhash": compute_dhash(pil),
+        }
+        st.session_state.uploaded_files[view] = entry
+    return entry
+
+def _looks_pristine(info):
+    """Validation info strongly suggests a clean view: few edges and a confident CLIP view match"""
+    return (
+        PRISTINE_SKIP_ENABLED
+        and info.get("edge_density", 1.0) < PRISTINE_MAX_EDGE_DENSITY
+        and info.get("prob", 0.0) > PRISTINE_MIN_VIEW_PROB
+    )
+
+async def _analyze_views(images, product_type, progress_bar):
+    """
+    Run Gemini damage analysis for every view concurrently
+    
+    At most GEMINI_MAX_CONCURRENCY requests are in flight; the progress bar
+    advances as each view finishes rather than in upload order.
+    
+    Returns:
+        Dict of {view_name: analysis_result} in the original view order
+    """
+    sem = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+
+    async def _analyze(view, img):
+        async with sem:
+            return view, await analyze_damage_with_gemini(img, view, product_type)
+
+    results = {}
+    tasks = [_analyze(view, img) for view, img in images.items()]
+    for done, next_result in enumerate(asyncio.as_completed(tasks), start=1):
+        view, result = await next_result
+        results[view] = result
+        progress_bar.progress(done / len(tasks))
+    return {view: results[view] for view in images}
 
 def render():
     st.title("📸 Photo Upload & Validation")
@@ -13,6 +86,7 @@ def render():
 
     # Back button to return to info page
     if st.button("⬅️ Back to Product Info", use_container_width=False):
+        release_inspection_state()
         st.session_state.step = 1
         st.rerun()
     
@@ -20,6 +94,20 @@ def render():
 
     inspection = st.session_state.inspection
     all_valid = True
+    validation_info = {}
+    
+    # Uploader values are already in session_state at the start of the rerun,
+    # so every current upload is validated at once instead of view by view
+    pending, digests = {}, {}
+    for view in inspection["views"]:
+        uploaded_file = st.session_state.get(f"upload_{view}")
+        if uploaded_file:
+            entry = _upload_entry(view, uploaded_file)
+            pending[view], digests[view] = entry["bytes"], entry["digest"]
+    validations = {}
+    if pending:
+        with st.spinner("Verifying photos..."):
+            validations = validate_all(pending, st.session_state.product_type, digests)
     
     for view in inspection["views"]:
         st.markdown(f"### {view}")
@@ -28,16 +116,25 @@ def render():
             ["jpg", "jpeg", "png"],
             key=f"upload_{view}"
         )
-        st.session_state.uploaded_files[view] = uploaded_file
         
         if uploaded_file:
+            entry = _upload_entry(view, uploaded_file)
+
             col1, col2 = st.columns([1, 2])
             with col1:
-                st.image(uploaded_file, width="stretch")
+                st.image(entry["bytes"], width="stretch")
             with col2:
-                b = get_file_bytes(uploaded_file)
-                with st.spinner(f"Verifying {view}..."):
-                    ok, reasons, info = get_cached_validation(b, view, st.session_state.product_type)
+                if view in validations:
+                    ok, reasons, info = validations[view]
+                else:
+                    with st.spinner(f"Verifying {view}..."):
+                        ok, reasons, info = get_cached_validation(
+                            entry["bytes"], view, st.session_state.product_type, entry["digest"]
+                        )
+                validation_info[view] = info
+                
+                if info.get("blur_level") == "borderline":
+                    st.warning(f"⚠️ Borderline sharpness — accepted")
                 
                 if ok:
                     st.success("✅ View verified!")
@@ -49,6 +146,7 @@ def render():
                     if info and "predicted" in info:
                         st.info(f"Detected as: {info['predicted']}")
         else:
+            st.session_state.uploaded_files[view] = None
             all_valid = False
         
         st.divider()
@@ -59,7 +157,18 @@ def render():
     if st.button(analyze_btn_label, disabled=not all_valid, type="primary"):
         st.info("Running consistency checks...")
         
-        duplicates = find_duplicates(st.session_state.uploaded_files)
+        # Decoded once at upload; CLIP and Gemini share these images, dHash was taken from them too
+        images = {
+            view: entry["pil"]
+            for view, entry in st.session_state.uploaded_files.items()
+            if entry is not None
+        }
+
+        duplicates = find_duplicates({
+            view: entry["dhash"]
+            for view, entry in st.session_state.uploaded_files.items()
+            if entry is not None
+        })
         if duplicates:
             st.error("❌ Duplicate images detected:")
             for v1, v2 in duplicates:
@@ -67,7 +176,7 @@ def render():
             st.stop()
 
         product_ok, pred_cat, _ = clip_product_check(
-            st.session_state.uploaded_files,
+            images,
             st.session_state.product_type
         )
         
@@ -77,29 +186,20 @@ def render():
 
 
         st.success("✅ All validations passed!")
-        # Re-running product check here as in original code logic (redundant but preserved)
-        product_ok, pred_cat, _ = clip_product_check(
-            st.session_state.uploaded_files,
-            st.session_state.product_type
-        )
-
-        if not product_ok:
-            st.error(f"❌ Category mismatch: Expected {st.session_state.product_type}, detected {pred_cat}")
-            st.stop()
-
-        # 🔒 SAME DEVICE CHECK — GEMINI
-        st.info("🔍 Verifying that all images belong to the same device...")
 
-        images = [
-            Image.open(f).convert("RGB")
-            for f in st.session_state.uploaded_files.values()
-            if f is not None
-        ]
+        # 🔒 SAME DEVICE CHECK + DAMAGE ANALYSIS — one Gemini request for all views
+        st.info("🔍 Verifying that all images belong to the same device and analyzing damage...")
 
-        same_device_result = verify_same_device_with_gemini(
-            images,
-            st.session_state.product_type
-        )
+        # Views the cheap pre-filters already rate as pristine skip Gemini damage analysis
+        pristine_views = [view for view in images if _looks_pristine(validation_info.get(view, {}))]
+        with st.spinner(f"Analyzing {len(images)} views..."):
+            same_device_result, analysis_results = run_async(
+                analyze_all_views_with_gemini(
+                    images,
+                    st.session_state.product_type,
+                    damage_views=[view for view in images if view not in pristine_views]
+                )
+            )
 
         if not same_device_result["same_device"]:
             st.error("❌ Images do NOT belong to the same physical device.")
@@ -111,26 +211,19 @@ def render():
             f"(confidence: {same_device_result['confidence']})"
         )
 
-        # Gemini Damage Analysis
-        st.markdown("### 🔍 Analyzing damage ...")
-        analysis_results = {}
-        
-        progress_bar = st.progress(0)
-        total_views = len(st.session_state.uploaded_files)
-        
-        for idx, (view, file) in enumerate(st.session_state.uploaded_files.items()):
-            image_file = file
-            # Ensure we are at start of file before reading
-            image_file.seek(0)
-            
-            with st.spinner(f"Analyzing {view}..."):
-                img = Image.open(image_file).convert("RGB")
-                analysis_results[view] = analyze_damage_with_gemini(
-                    img, 
-                    view, 
-                    st.session_state.product_type
-                )
-            progress_bar.progress((idx + 1) / total_views)
+        for view in pristine_views:
+            analysis_results[view] = {"issues": [], "overall_condition": "pristine"}
+
+        # Per-view fallback for any view the combined response did not cover
+        missing = {view: img for view, img in images.items() if view not in analysis_results}
+        if missing:
+            st.markdown("### 🔍 Analyzing remaining views ...")
+            progress_bar = st.progress(0)
+            with st.spinner(f"Analyzing {len(missing)} views..."):
+                analysis_results.update(run_async(
+                    _analyze_views(missing, st.session_state.product_type, progress_bar)
+                ))
+        analysis_results = {view: analysis_results[view] for view in images}
         
         st.session_state.analysis_results = analysis_results
         st.success("✅ Analysis complete!")
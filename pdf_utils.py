@@ -1,85 +1,103 @@
 """
 PDF Generation Utility for Resello AI
 """
-from fpdf import FPDF
-import datetime
+import re
 
-class ReselloPDF(FPDF):
-    def header(self):
-        self.set_font('helvetica', 'B', 15)
-        self.cell(0, 10, 'Resello AI - Physical Condition Report', border=False, ln=True, align='C')
-        self.ln(5)
+_PDF_CLS = None
 
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('helvetica', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}/{{nb}} - Generated on {datetime.datetime.now().strftime("%Y-%m-%d %H:%M")}', align='C')
+# fpdf2's markdown also toggles italics on '__', underline on '--' and strikethrough on '~~';
+# Gemini's '---' rules and snake_case names would flip those, so escape everything but '**'
+# (the backslash escape needs fpdf2 >= 2.8.1)
+_NON_BOLD_MARKERS = re.compile(r'(__|--|~~)')
+
+def _get_pdf_cls():
+    """Build the ReselloPDF class on first use so fpdf is only imported when a PDF is made"""
+    global _PDF_CLS
+    if _PDF_CLS is None:
+        import datetime
+        from fpdf import FPDF
+
+        class ReselloPDF(FPDF):
+            def header(self):
+                self.set_font('helvetica', 'B', 15)
+                self.cell(0, 10, 'Resello AI - Physical Condition Report', border=False, align='C', new_x="LMARGIN", new_y="NEXT")
+                self.ln(5)
+
+            def footer(self):
+                self.set_y(-15)
+                self.set_font('helvetica', 'I', 8)
+                self.cell(0, 10, f'Page {self.page_no()}/{{nb}} - Generated on {datetime.datetime.now().strftime("%Y-%m-%d %H:%M")}', align='C')
+
+        _PDF_CLS = ReselloPDF
+    return _PDF_CLS
+
+# new_x/new_y replace the deprecated ln=True (which also warns on every call)
+_NEXT_LINE = dict(new_x="LMARGIN", new_y="NEXT")
+
+def _kv(pdf, label, value, label_w=50):
+    """One 'label: value' row"""
+    pdf.cell(label_w, 8, label, border=False)
+    pdf.cell(0, 8, value, **_NEXT_LINE)
 
 def generate_pdf_report(product_name, product_type, usage_years, pricing_results, ai_report):
     """
     Generate a PDF report using fpdf2
     """
-    pdf = ReselloPDF()
+    pdf = _get_pdf_cls()()
     pdf.add_page()
     pdf.set_auto_page_break(auto=True, margin=15)
     
     # Product Info
     pdf.set_font('helvetica', 'B', 12)
-    pdf.cell(0, 10, 'Product Information', ln=True)
+    pdf.cell(0, 10, 'Product Information', **_NEXT_LINE)
     pdf.set_font('helvetica', '', 10)
-    pdf.cell(50, 8, f'Product Name:', border=False)
-    pdf.cell(0, 8, f'{product_name}', ln=True)
-    pdf.cell(50, 8, f'Category:', border=False)
-    pdf.cell(0, 8, f'{product_type}', ln=True)
-    pdf.cell(50, 8, f'Usage Duration:', border=False)
-    pdf.cell(0, 8, f'{usage_years} years', ln=True)
+    _kv(pdf, 'Product Name:', f'{product_name}')
+    _kv(pdf, 'Category:', f'{product_type}')
+    _kv(pdf, 'Usage Duration:', f'{usage_years} years')
     pdf.ln(5)
     
     # Pricing Summary
     pdf.set_font('helvetica', 'B', 12)
-    pdf.cell(0, 10, 'Pricing Analysis', ln=True)
+    pdf.cell(0, 10, 'Pricing Analysis', **_NEXT_LINE)
     pdf.set_font('helvetica', '', 10)
-    pdf.cell(50, 8, f'New Market Price:', border=False)
-    pdf.cell(0, 8, f'EGP {pricing_results["base_price"]:,.0f}', ln=True)
-    pdf.cell(50, 8, f'Final Suggested Resale:', border=False)
+    _kv(pdf, 'New Market Price:', f'EGP {pricing_results["base_price"]:,.0f}')
+    pdf.cell(50, 8, 'Final Suggested Resale:', border=False)
     pdf.set_font('helvetica', 'B', 10)
-    pdf.cell(0, 8, f'EGP {pricing_results["final_price"]:,.0f}', ln=True)
+    pdf.cell(0, 8, f'EGP {pricing_results["final_price"]:,.0f}', **_NEXT_LINE)
     pdf.set_font('helvetica', '', 10)
-    pdf.cell(50, 8, f'Total Depreciation:', border=False)
-    pdf.cell(0, 8, f'{pricing_results["total_depreciation_rate"]*100:.1f}%', ln=True)
+    _kv(pdf, 'Total Depreciation:', f'{pricing_results["total_depreciation_rate"]*100:.1f}%')
     pdf.ln(5)
     
     # Depreciation Breakdown
     pdf.set_font('helvetica', 'B', 12)
-    pdf.cell(0, 10, 'Depreciation Breakdown', ln=True)
+    pdf.cell(0, 10, 'Depreciation Breakdown', **_NEXT_LINE)
     pdf.set_font('helvetica', '', 10)
-    pdf.cell(60, 8, f'- Age Depreciation ({usage_years}y):', border=False)
-    pdf.cell(0, 8, f'-{pricing_results["age_depreciation"]["rate"]*100:.0f}% (-EGP {pricing_results["age_depreciation"]["amount"]:,.0f})', ln=True)
+    _kv(pdf, f'- Age Depreciation ({usage_years}y):', f'-{pricing_results["age_depreciation"]["rate"]*100:.0f}% (-EGP {pricing_results["age_depreciation"]["amount"]:,.0f})', label_w=60)
     
     def_rate = pricing_results['defect_depreciation']['rate'] * 100
-    pdf.cell(60, 8, f'- Defects & Wear:', border=False)
-    pdf.cell(0, 8, f'-{def_rate:.1f}% (-EGP {pricing_results["defect_depreciation"]["amount"]:,.0f})', ln=True)
+    _kv(pdf, '- Defects & Wear:', f'-{def_rate:.1f}% (-EGP {pricing_results["defect_depreciation"]["amount"]:,.0f})', label_w=60)
     
     if pricing_results['defect_depreciation']['breakdown']:
+        pdf.set_font('helvetica', 'I', 9)
         for item in pricing_results['defect_depreciation']['breakdown']:
-            pdf.set_font('helvetica', 'I', 9)
             pdf.cell(10)
-            pdf.cell(0, 7, f'* {item["type"].title()} ({item["severity"]}): -{item["rate"]*100:.0f}%', ln=True)
+            pdf.cell(0, 7, f'* {item["type"].title()} ({item["severity"]}): -{item["rate"]*100:.0f}%', **_NEXT_LINE)
     pdf.ln(10)
     
     # AI Report
     pdf.set_font('helvetica', 'B', 12)
-    pdf.cell(0, 10, 'AI Inspection Summary', ln=True)
+    pdf.cell(0, 10, 'AI Inspection Summary', **_NEXT_LINE)
     pdf.set_font('helvetica', '', 10)
     
     # Since fpdf2 doesn't handle UTF-8/Arabic out of the box easily without adding fonts,
-    # and the prompt asks for AR/EN tabs in UI, for the PDF we'll strip markdown and try to print.
+    # and the prompt asks for AR/EN tabs in UI, for the PDF we'll strip headings and try to print.
     # IMPORTANT: Real Arabic support in PDF requires a .ttf font file.
     
-    # Let's clean up the report text a bit for the PDF
-    clean_report = ai_report.replace('**', '').replace('#', '').replace('###', '')
+    # fpdf2 renders **bold** natively with markdown=True; it has no heading syntax, so drop '#'
+    clean_report = ai_report.replace('#', '').replace('\\', '\\\\')
+    clean_report = _NON_BOLD_MARKERS.sub(r'\\\1', clean_report)
     
     # Multi-line text handling
-    pdf.multi_cell(0, 8, clean_report)
+    pdf.multi_cell(0, 8, clean_report, markdown=True)
     
-    return pdf.output(dest='S') # Return as byte string
+    return bytes(pdf.output())
@@ -2,6 +2,8 @@
 Price Calculator utility for Re-Commerce AI
 Handles depreciation logic based on usage years and physical defects.
 """
+import re
+from functools import lru_cache
 from typing import List, Dict
 
 class PriceCalculator:
@@ -18,6 +20,8 @@ class PriceCalculator:
             7: 0.60
         }
         
+        self._age_get = self.age_depreciation_map.get
+        
         # Defect-based depreciation rates
         self.defect_rates = {
             "scratches": {"low": 0.02, "medium": 0.05, "high": 0.08},
@@ -28,13 +32,25 @@ class PriceCalculator:
             "broken parts": {"low": 0.15, "medium": 0.30, "high": 0.50},
             "other": {"low": 0.02, "medium": 0.05, "high": 0.10}
         }
+        
+        # Flat (category, severity) -> rate table and a single category matcher.
+        # The lookahead finds every (even overlapping) category substring; the lowest
+        # rank wins, matching the first-in-dict-order priority of the rates above.
+        self._flat_rates = {(cat, sev): r for cat, sevs in self.defect_rates.items() for sev, r in sevs.items()}
+        self._cat_rank = {cat: i for i, cat in enumerate(self.defect_rates)}
+        self._cat_re = re.compile("(?=(" + "|".join(map(re.escape, self.defect_rates)) + "))")
+        # Gemini reuses a handful of type strings, so repeats skip the scan entirely
+        self._match_category = lru_cache(maxsize=512)(self._match_category)
 
     def calculate_age_depreciation(self, years: float) -> float:
         """Calculate depreciation based on usage years"""
         whole_years = int(years)
-        if whole_years in self.age_depreciation_map:
-            return self.age_depreciation_map[whole_years]
-        return 0.60 if whole_years > 7 else 0.15
+        return self._age_get(whole_years, 0.60 if whole_years > 7 else 0.15)
+
+    def _match_category(self, issue_type: str) -> str:
+        """Highest-priority defect category contained in issue_type, else 'other'"""
+        found = [m.group(1) for m in self._cat_re.finditer(issue_type)]
+        return min(found, key=self._cat_rank.__getitem__) if found else "other"
 
     def calculate_defect_depreciation(self, issues: List[Dict]) -> Dict:
         """
@@ -43,26 +59,26 @@ class PriceCalculator:
         """
         total_rate = 0.0
         breakdown = []
+        flat_rates = self._flat_rates
+        match_category = self._match_category
+        append = breakdown.append
         
         for issue in issues:
-            issue_type = issue.get("type", "other").lower()
-            severity = issue.get("severity", "low").lower()
+            get = issue.get
+            issue_type = get("type", "other").lower()
+            severity = get("severity", "low").lower()
             
             # Find closest matching type
-            rate_category = "other"
-            for category in self.defect_rates:
-                if category in issue_type:
-                    rate_category = category
-                    break
+            rate_category = match_category(issue_type)
             
-            rate = self.defect_rates[rate_category].get(severity, self.defect_rates[rate_category]["low"])
+            rate = flat_rates.get((rate_category, severity), flat_rates[(rate_category, "low")])
             total_rate += rate
             
-            breakdown.append({
+            append({
                 "type": issue_type,
                 "severity": severity,
                 "rate": rate,
-                "description": issue.get("description", "")
+                "description": get("description", "")
             })
             
         # Cap defect depreciation at 50%
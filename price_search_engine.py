@@ -1,9 +1,124 @@
 from typing import List, Dict, Optional
-from serpapi import GoogleSearch
 import re
 import os
+import json
+import threading
+import time
+import functools
+import hashlib
+import heapq
+import operator
+import statistics
+from concurrent import futures
+import streamlit as st
+from config import PRICE_CACHE_MAX, PRICE_CACHE_PATH, PRICE_CACHE_TTL
+
+_price_cache_lock = threading.Lock()
+_search_executor = futures.ThreadPoolExecutor(max_workers=4)
+# Seconds to wait for the organic backfill once shopping results come up short
+ORGANIC_SEARCH_TIMEOUT = 5
+# Number of cheapest results kept in a price report
+TOP_RESULTS = 5
+
+def _load_price_cache() -> Dict:
+    """Load unexpired persisted price reports; a missing or corrupt file starts empty"""
+    try:
+        with open(PRICE_CACHE_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    now = time.time()
+    return {k: entry for k, entry in data.items() if now - entry.get("ts", 0) < PRICE_CACHE_TTL}
+
+_price_cache = _load_price_cache()
+
+def _get_cached_price(key: str) -> Optional[Dict]:
+    """Return the cached report for key if it is younger than PRICE_CACHE_TTL"""
+    entry = _price_cache.get(key)
+    if entry and time.time() - entry["ts"] < PRICE_CACHE_TTL:
+        return entry["report"]
+    return None
+
+def _put_cached_price(key: str, report: Dict):
+    """Store a report, drop expired and oldest-beyond-PRICE_CACHE_MAX entries, and rewrite the file atomically"""
+    now = time.time()
+    with _price_cache_lock:
+        _price_cache[key] = {"report": report, "ts": now}
+        for k in [k for k, entry in _price_cache.items() if now - entry["ts"] >= PRICE_CACHE_TTL]:
+            del _price_cache[k]
+        for k in heapq.nsmallest(len(_price_cache) - PRICE_CACHE_MAX, _price_cache, key=lambda k: _price_cache[k]["ts"]):
+            del _price_cache[k]
+        try:
+            os.makedirs(os.path.dirname(PRICE_CACHE_PATH) or ".", exist_ok=True)
+            tmp = PRICE_CACHE_PATH + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(_price_cache, f, ensure_ascii=False)
+            os.replace(tmp, PRICE_CACHE_PATH)
+        except OSError:
+            pass
+
+class _PriceNotFound(Exception):
+    """Raised out of _search_cached so st.cache_data doesn't store a miss"""
+    def __init__(self, report: Dict):
+        super().__init__(report.get("product"))
+        self.report = report
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def _search_cached(brand: str, model: str, key_hash: str, _engine: "PriceSearchEngine") -> Dict:
+    """
+    Memoized price search; reruns and other sessions get the result without SerpAPI calls
+    
+    key_hash (a short digest of the SerpAPI key) is part of the cache key so swapping keys
+    re-queries; the engine itself is not hashed. Reports without a price are raised as
+    _PriceNotFound (exceptions are never cached), so a transient failure isn't pinned.
+    """
+    report = _engine._search_uncached(brand, model)
+    if report["price"] is None:
+        raise _PriceNotFound(report)
+    return report
+
+_NON_NUMERIC_RE = re.compile(r'[^0-9.]')
+# Characters Shopping price strings actually carry ("EGP 12,999.00", "E£1,200", "LE 850");
+# str.translate drops them in C, the regex above handles anything else
+_PRICE_STRIP = str.maketrans("", "", " ,EGPL£$€\xa0")
+
+# URL substring -> store name, in priority order
+_STORE_MAP = {
+    "jumia": "Jumia Egypt",
+    "noon": "Noon",
+    "b.tech": "B.TECH",
+    "dream2000": "Dream 2000",
+    "dubaiphone": "Dubai Phone",
+    "xcite": "Xcite",
+    "souq": "Souq",
+    "2b.com": "2B Egypt",
+    "elaraby": "El Araby Group"
+}
+_STORE_RANK = {key: i for i, key in enumerate(_STORE_MAP)}
+_STORE_RE = re.compile("(?=(" + "|".join(map(re.escape, _STORE_MAP)) + "))")
 
 class PriceSearchEngine:
+    # Words that indicate a number is NOT a price (substring match, one C-level scan)
+    _INVALID_CONTEXT = frozenset(["star", "rating", "review", "piece", "item", "year",
+                                  "warranty", "month", "قسط", "شهور", "gb", "inch", "cm"])
+    _INVALID_CTX_RE = re.compile("|".join(map(re.escape, sorted(_INVALID_CONTEXT))))
+    
+    # Primary: Patterns with currency symbols
+    _CURRENCY_PATTERNS = [
+        re.compile(r'(?:EGP|LE|ج\.م|جنيه)\s*([0-9,]+(?:\.[0-9]{2})?)', re.IGNORECASE),
+        re.compile(r'([0-9,]+(?:\.[0-9]{2})?)\s*(?:EGP|LE|ج\.م|جنيه)', re.IGNORECASE)
+    ]
+    # Every currency pattern needs one of these (lowercased) tokens to match at all
+    _CURRENCY_TOKENS = ("egp", "le", "ج.م", "جنيه")
+    # Every pattern needs an ASCII digit; snippets without one cannot hold a price
+    _DIGIT_RE = re.compile(r'[0-9]')
+    
+    # Fallback: Numbers that look like prices
+    _NUMBER_PATTERNS = [
+        re.compile(r'\b([1-9][0-9]{1,2},[0-9]{3}(?:,[0-9]{3})*)\b'),  # 15,999 or 1,234,567
+        re.compile(r'\b([1-9][0-9]{4,5})\b')  # 10000 to 999999
+    ]
+
     def __init__(self, api_key: str = None):
         self.api_key = api_key or os.getenv("SERPAPI_KEY")
         self.egyptian_sites = [
@@ -11,23 +126,50 @@ class PriceSearchEngine:
             "dream2000.com", "b.tech", "xcite.com", "souq.com", "elarabygroup.com", "2b.com.eg"
         ]
         self.used_keywords = ["used", "refurbished", "مستعمل", "مجدد", "open box", "renewed"]
+        self._used_re = re.compile("|".join(map(re.escape, self.used_keywords)), re.IGNORECASE)
 
     def search_product_price(self, brand: str, model: str, category: str = None) -> Dict:
-        """Main entry point for price search"""
+        """Main entry point for price search (memoized in-process per brand/model/key)"""
+        key_hash = hashlib.blake2b((self.api_key or "").encode(), digest_size=8).hexdigest()
+        try:
+            return _search_cached(brand, model, key_hash, self)
+        except _PriceNotFound as miss:
+            return miss.report
+
+    def _search_uncached(self, brand: str, model: str) -> Dict:
+        """Price search backed by the disk cache (PRICE_CACHE_TTL), then SerpAPI"""
         query = f"{brand} {model}"
+        cache_key = f"{brand}|{model}".lower()
+        cached = _get_cached_price(cache_key)
+        if cached is not None:
+            print(f"[SEARCH] Cache hit for: {query}")
+            return cached
+        
+        # Start both searches at once; organic is only a backfill, so the slow path
+        # costs max(shopping, organic) instead of their sum
+        shopping_future = _search_executor.submit(self.search_google_shopping, query)
+        organic_future = _search_executor.submit(self.search_organic, query)
         
-        # Try Google Shopping first (most reliable)
-        shopping_results = self.search_google_shopping(query)
-        processed = self.process_shopping_results(shopping_results)
+        # Google Shopping first (most reliable)
+        processed = self.process_shopping_results(shopping_future.result())
         
-        # If not enough results, try organic search
+        # If not enough results, merge organic search
         if len(processed) < 3:
-            print(f"[SEARCH] Only {len(processed)} shopping results, trying organic search...")
-            organic_results = self.search_organic(query)
-            organic_processed = self.process_results(organic_results, query)
-            processed.extend(organic_processed)
+            print(f"[SEARCH] Only {len(processed)} shopping results, using organic search...")
+            try:
+                organic_results = organic_future.result(timeout=ORGANIC_SEARCH_TIMEOUT)
+            except futures.TimeoutError:
+                print(f"[ORGANIC ERROR] Timed out after {ORGANIC_SEARCH_TIMEOUT}s")
+                organic_results = []
+            processed.extend(self.process_results(organic_results, query))
+        else:
+            organic_future.cancel()
         
-        return self.create_report(query, processed)
+        report = self.create_report(query, processed)
+        # Don't pin a miss for a day; it may be a transient API failure
+        if report["price"] is not None:
+            _put_cached_price(cache_key, report)
+        return report
 
     def search_google_shopping(self, product: str) -> List[Dict]:
         """Search using Google Shopping API (most reliable for prices)"""
@@ -44,6 +186,7 @@ class PriceSearchEngine:
         }
         
         try:
+            from serpapi import GoogleSearch  # deferred: only pricing pulls in serpapi/requests
             search = GoogleSearch(params)
             results = search.get_dict().get("shopping_results", [])
             print(f"[SHOPPING] Found {len(results)} shopping results for: {product}")
@@ -68,6 +211,7 @@ class PriceSearchEngine:
         }
         
         try:
+            from serpapi import GoogleSearch  # deferred: only pricing pulls in serpapi/requests
             search = GoogleSearch(params)
             results = search.get_dict().get("organic_results", [])
             print(f"[ORGANIC] Found {len(results)} organic results for: {product}")
@@ -79,6 +223,7 @@ class PriceSearchEngine:
     def process_shopping_results(self, results: List[Dict]) -> List[Dict]:
         """Process Google Shopping results"""
         processed = []
+        append = processed.append
         
         for r in results:
             title = r.get("title", "")
@@ -88,7 +233,7 @@ class PriceSearchEngine:
             
             # Filter used/refurbished
             text = f"{title}".lower()
-            if any(k in text for k in self.used_keywords):
+            if self._used_re.search(text):
                 continue
             
             # Extract price from shopping result
@@ -96,7 +241,7 @@ class PriceSearchEngine:
             if not price:
                 continue
             
-            processed.append({
+            append({
                 "title": title,
                 "store": source or "Online Store",
                 "price": price,
@@ -108,6 +253,7 @@ class PriceSearchEngine:
     def process_results(self, results: List[Dict], product: str) -> List[Dict]:
         """Filter and extract prices from organic search results"""
         processed = []
+        append = processed.append
         
         for r in results:
             title = r.get("title", "")
@@ -116,7 +262,7 @@ class PriceSearchEngine:
             
             # Filter used/refurbished
             text = f"{title} {snippet}".lower()
-            if any(k in text for k in self.used_keywords):
+            if self._used_re.search(text):
                 continue
             
             # Extract price
@@ -127,7 +273,7 @@ class PriceSearchEngine:
             # Extract store
             store = self.extract_store(link)
             
-            processed.append({
+            append({
                 "title": title,
                 "store": store,
                 "price": price,
@@ -136,14 +282,18 @@ class PriceSearchEngine:
         
         return processed
 
-    def extract_price_from_shopping(self, price_str: str) -> Optional[float]:
+    @staticmethod
+    @functools.lru_cache(maxsize=512)
+    def extract_price_from_shopping(price_str: str) -> Optional[float]:
         """Extract price from Google Shopping price string"""
         if not price_str:
             return None
         
         try:
             # Remove currency symbols and commas
-            cleaned = re.sub(r'[^0-9.]', '', price_str)
+            cleaned = price_str.translate(_PRICE_STRIP)
+            if not (cleaned.isascii() and cleaned.replace('.', '', 1).isdigit()):
+                cleaned = _NON_NUMERIC_RE.sub('', price_str)
             price = float(cleaned)
             
             # Validate range
@@ -156,29 +306,16 @@ class PriceSearchEngine:
 
     def extract_price(self, text: str) -> Optional[float]:
         """Extract Egyptian pound prices from text"""
-        text_lower = text.lower()
-        
-        # Words that indicate this number is NOT a price
-        invalid_context = ["star", "rating", "review", "piece", "item", "year", 
-                        "warranty", "month", "قسط", "شهور", "gb", "inch", "cm"]
-        
-        # Primary: Patterns with currency symbols
-        currency_patterns = [
-            r'(?:EGP|LE|ج\.م|جنيه)\s*([0-9,]+(?:\.[0-9]{2})?)',
-            r'([0-9,]+(?:\.[0-9]{2})?)\s*(?:EGP|LE|ج\.م|جنيه)'
-        ]
-        
-        # Fallback: Numbers that look like prices
-        number_patterns = [
-            r'\b([1-9][0-9]{1,2},[0-9]{3}(?:,[0-9]{3})*)\b',  # 15,999 or 1,234,567
-            r'\b([1-9][0-9]{4,5})\b'  # 10000 to 999999
-        ]
+        if not self._DIGIT_RE.search(text):
+            return None
         
+        text_lower = text.lower()
         found_prices = []
         
-        # Try currency patterns first
-        for pattern in currency_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
+        # Try currency patterns first (only if a currency token is present at all)
+        has_currency = any(tok in text_lower for tok in self._CURRENCY_TOKENS)
+        for pattern in (self._CURRENCY_PATTERNS if has_currency else ()):
+            matches = pattern.finditer(text)
             for match in matches:
                 try:
                     price_str = match.group(1).replace(',', '')
@@ -188,7 +325,7 @@ class PriceSearchEngine:
                     start, end = match.span()
                     context = text_lower[max(0, start-20):min(len(text_lower), end+20)]
                     
-                    if any(word in context for word in invalid_context):
+                    if self._INVALID_CTX_RE.search(context):
                         continue
                     
                     if 500 <= price_val <= 200000:
@@ -198,8 +335,8 @@ class PriceSearchEngine:
         
         # If no currency prices found, try number patterns
         if not found_prices:
-            for pattern in number_patterns:
-                matches = re.finditer(pattern, text)
+            for pattern in self._NUMBER_PATTERNS:
+                matches = pattern.finditer(text)
                 for match in matches:
                     try:
                         price_str = match.group(1).replace(',', '')
@@ -209,7 +346,7 @@ class PriceSearchEngine:
                         start, end = match.span()
                         context = text_lower[max(0, start-30):min(len(text_lower), end+30)]
                         
-                        if any(word in context for word in invalid_context):
+                        if self._INVALID_CTX_RE.search(context):
                             continue
                         
                         # Stricter range for numbers without currency
@@ -223,24 +360,14 @@ class PriceSearchEngine:
         
         return max(found_prices)
 
-    def extract_store(self, url: str) -> str:
+    @staticmethod
+    @functools.lru_cache(maxsize=512)
+    def extract_store(url: str) -> str:
         """Extract store name from URL"""
-        store_map = {
-            "jumia": "Jumia Egypt",
-            "noon": "Noon",
-            "b.tech": "B.TECH",
-            "dream2000": "Dream 2000",
-            "dubaiphone": "Dubai Phone",
-            "xcite": "Xcite",
-            "souq": "Souq",
-            "2b.com": "2B Egypt",
-            "elaraby": "El Araby Group"
-        }
-        
-        url_lower = url.lower()
-        for key, name in store_map.items():
-            if key in url_lower:
-                return name
+        # Every (possibly overlapping) key hit in one scan; the earliest key in _STORE_MAP wins
+        hits = [m.group(1) for m in _STORE_RE.finditer(url.lower())]
+        if hits:
+            return _STORE_MAP[min(hits, key=_STORE_RANK.__getitem__)]
         
         return "Egyptian Retailer"
 
@@ -258,16 +385,16 @@ class PriceSearchEngine:
                 "results": []
             }
         
-        # Sort by price (cheapest first)
-        results = sorted(results, key=lambda x: x["price"])
+        # Only the cheapest few are kept, so select them instead of sorting everything
+        top_results = heapq.nsmallest(TOP_RESULTS, results, key=operator.itemgetter("price"))
         
         prices = [r["price"] for r in results]
-        min_price = min(prices)
+        min_price = top_results[0]["price"]
         max_price = max(prices)
-        median_price = sorted(prices)[len(prices)//2]
+        median_price = statistics.median_high(prices)  # upper middle, as before
         
         print(f"\n[REPORT] ✅ Success! {len(results)} results")
-        print(f"[REPORT] Best price: EGP {min_price:,.2f} at {results[0]['store']}")
+        print(f"[REPORT] Best price: EGP {min_price:,.2f} at {top_results[0]['store']}")
         print(f"[REPORT] Price range: EGP {min_price:,.0f} - {max_price:,.0f}")
         
         return {
@@ -276,7 +403,7 @@ class PriceSearchEngine:
             "confidence": min(0.95, 0.6 + len(results) * 0.05),
             "currency": "EGP",
             "total_results": len(results),
-            "results": results,  # Full results array with store details
+            "results": top_results,  # Cheapest TOP_RESULTS results with store details
             "price_statistics": {
                 "min": min_price,
                 "max": max_price,
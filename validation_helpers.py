@@ -1,43 +1,86 @@
 """
 Image validation helper functions
 """
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 import streamlit as st
 from PIL import Image
 import imagehash
 import cv2
 import numpy as np
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 
 from config import PRODUCT_INSPECTION_VIEWS, CONFIG
-from clip_utils import clip_view_check
+from clip_utils import clip_view_check_batch, prepare_clip_input, release_memory
 
 # ---------------- Helpers ----------------
+# cv2/PIL/torch release the GIL while decoding and filtering, so views validate in parallel
+_validation_executor = ThreadPoolExecutor(max_workers=8)
+
 def get_inspection_views(product_type):
     """Get required views for a product type"""
     return PRODUCT_INSPECTION_VIEWS[product_type]
 
-def compute_phash(image_file):
-    """Calculate perceptual hash for duplicate detection"""
-    return imagehash.phash(Image.open(image_file).convert("RGB"))
+def decode_image_bytes(file_bytes):
+    """
+    Decode an upload into the arrays every check needs
+    
+    Gray comes from the decoder's own grayscale path (the JPEG luma plane), which
+    the blur thresholds were calibrated on; converting from BGR shifts scores.
+    
+    Returns:
+        Tuple of (rgb, gray) uint8 arrays; rgb is (H, W, 3), gray is (H, W)
+    """
+    buf = np.frombuffer(file_bytes, dtype=np.uint8)
+    bgr = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB), cv2.imdecode(buf, cv2.IMREAD_GRAYSCALE)
+
+def compute_dhash(image_file):
+    """
+    Calculate difference hash for duplicate detection (file, already-decoded PIL Image,
+    or a previously computed hash, returned as-is)
+    
+    dHash compares adjacent pixels of a 9x8 grayscale thumbnail: nearly as
+    robust as pHash for near-duplicate photos, without the DCT.
+    """
+    if isinstance(image_file, imagehash.ImageHash):
+        return image_file
+    if isinstance(image_file, Image.Image):
+        return imagehash.dhash(image_file)
+    img = Image.open(image_file)
+    # Let JPEG decode straight to a small grayscale draft
+    img.draft("L", (64, 64))
+    return imagehash.dhash(img)
 
 def find_duplicates(uploaded_files, threshold=5):
     """
-    Find duplicate images using perceptual hashing
+    Find duplicate images using difference hashing
+    
+    Views are bucketed by exact hash, so identical photos are found with a dict
+    lookup and each distinct hash is compared only once.
     
     Args:
-        uploaded_files: Dict of {view_name: file}
+        uploaded_files: Dict of {view_name: file, PIL Image or precomputed ImageHash}
         threshold: Hash distance threshold for duplicates
     
     Returns:
         List of tuples (view1, view2) that are duplicates
     """
-    hashes, duplicates = {}, []
-    for view, file in uploaded_files.items():
-        h = compute_phash(file)
-        for pv, ph in hashes.items():
-            if abs(h - ph) <= threshold:
-                duplicates.append((view, pv))
-        hashes[view] = h
+    buckets, duplicates = {}, []
+    hashes = _validation_executor.map(compute_dhash, uploaded_files.values())
+    for view, dh in zip(uploaded_files, hashes):
+        h = int(str(dh), 16)
+        if threshold == 0:
+            duplicates.extend((view, pv) for pv in buckets.get(h, ()))
+        else:
+            for ph, views in buckets.items():
+                if (h ^ ph).bit_count() <= threshold:
+                    duplicates.extend((view, pv) for pv in views)
+        buckets.setdefault(h, []).append(view)
     return duplicates
 
 def is_blurry(image_file, product_type):
@@ -45,54 +88,180 @@ def is_blurry(image_file, product_type):
     Detect blurry images using Laplacian variance
     
     Args:
-        image_file: Uploaded image file
+        image_file: Uploaded image file or decoded grayscale uint8 array
         product_type: "Laptop" or "Mobile"
     
     Returns:
         Tuple of (is_blurry, score, level)
         level can be: "severe", "borderline", or "sharp"
     """
-    file_bytes = np.asarray(bytearray(image_file.read()), dtype=np.uint8)
-    img = cv2.imdecode(file_bytes, cv2.IMREAD_GRAYSCALE)
-    image_file.seek(0)
+    if isinstance(image_file, np.ndarray):
+        img = image_file
+    else:
+        file_bytes = np.frombuffer(image_file.read(), dtype=np.uint8)
+        img = cv2.imdecode(file_bytes, cv2.IMREAD_GRAYSCALE)
+        image_file.seek(0)
 
-    score = cv2.Laplacian(img, cv2.CV_64F).var()
+    # The 3x3 stencil on uint8 stays within +-1020, so int16 output is exact
+    _, stddev = cv2.meanStdDev(cv2.Laplacian(img, cv2.CV_16S))
+    score = float(stddev[0, 0]) ** 2
 
-    if product_type == "Laptop":
-        if score < 30:
-            return True, score, "severe"
-        elif score < 45:
-            return False, score, "borderline"
-        else:
-            return False, score, "sharp"
+    cfg = CONFIG[product_type]
+    if score < cfg["blur_severe"]:
+        return True, score, "severe"
+    if score < cfg["blur_borderline"]:
+        return False, score, "borderline"
+    return False, score, "sharp"
 
-    if product_type == "Mobile":
-        if score < 12:
-            return True, score, "severe"
-        elif score < 18:
-            return False, score, "borderline"
-        else:
-            return False, score, "sharp"
+def edge_density(gray, max_side=512):
+    """
+    Fraction of Canny edge pixels, a cheap visual-complexity score
+    
+    Computed on a copy downscaled to max_side so the score does not depend on
+    upload resolution. Clean, uniform surfaces score near 0.
+    """
+    scale = max_side / max(gray.shape)
+    if scale < 1:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    edges = cv2.Canny(gray, 100, 200)
+    return float(np.count_nonzero(edges)) / edges.size
 
 def validate_resolution(image_file, product_type):
     """
     Check minimum resolution requirements
     
     Args:
-        image_file: Uploaded image file
+        image_file: Uploaded image file or decoded image array
         product_type: "Laptop" or "Mobile"
     
     Returns:
         Tuple of (is_valid, width, height)
     """
-    min_w = CONFIG[product_type]["min_width"]
-    min_h = CONFIG[product_type]["min_height"]
-    w, h = Image.open(image_file).size
-    image_file.seek(0)
+    cfg = CONFIG[product_type]
+    min_w, min_h = cfg["min_width"], cfg["min_height"]
+    if isinstance(image_file, np.ndarray):
+        h, w = image_file.shape[:2]
+    else:
+        w, h = Image.open(image_file).size
+        image_file.seek(0)
     return (w >= min_w and h >= min_h), w, h
 
-@st.cache_data(show_spinner=False)
-def get_cached_validation(file_bytes, view_name, product_type):
+# Validation results are kept this long, for at most this many uploads (least recently used go first)
+_VALIDATION_TTL = 3600
+_VALIDATION_MAX = 512
+_validation_lock = threading.Lock()
+
+@st.cache_resource
+def _validation_store():
+    """Process-wide {(bytes digest, view_name, product_type): (timestamp, validation result)} LRU"""
+    return OrderedDict()
+
+def _store_get(key):
+    """Copy of a fresh stored result (sessions never share mutable info dicts), else None"""
+    store = _validation_store()
+    with _validation_lock:
+        hit = store.get(key)
+        if hit is None:
+            return None
+        if time.time() - hit[0] >= _VALIDATION_TTL:
+            del store[key]
+            return None
+        store.move_to_end(key)
+        return copy.deepcopy(hit[1])
+
+def _store_put(key, result):
+    """Store a copy of result, evicting expired and then least recently used entries"""
+    store = _validation_store()
+    now = time.time()
+    with _validation_lock:
+        store[key] = (now, copy.deepcopy(result))
+        store.move_to_end(key)
+        while store and now - next(iter(store.values()))[0] >= _VALIDATION_TTL:
+            store.popitem(last=False)
+        while len(store) > _VALIDATION_MAX:
+            store.popitem(last=False)
+
+def _prechecks(file_bytes, product_type):
+    """
+    Resolution (header only) and blur checks on a single decode
+    
+    Returns:
+        Tuple of (failure, clip_input, level, edge_density); failure is None when
+        the image may go on to the CLIP view check
+    """
+    # Image.open only parses the header, so low-res uploads are rejected undecoded
+    ok_res, w, h = validate_resolution(BytesIO(file_bytes), product_type)
+    if not ok_res:
+        return (False, [f"Resolution too low: {w}x{h}"], {}), None, None, None
+    
+    # Decoded once per colour space for blur, edge density and CLIP
+    rgb, gray = decode_image_bytes(file_bytes)
+    is_blur, score, level = is_blurry(gray, product_type)
+
+    if is_blur:
+        return (False, [f"Image too blurry ({level})"], {}), None, None, None
+    # CLIP preprocessing also runs here on the worker, so only 224px tensors outlive it
+    return None, prepare_clip_input(rgb), level, edge_density(gray)
+
+def content_digest(file_bytes):
+    """Short blake2b digest identifying an upload's content"""
+    return hashlib.blake2b(file_bytes, digest_size=16).digest()
+
+def validate_all(files_bytes, product_type, digests=None):
+    """
+    Validate several views: cheap checks concurrently, then one batched CLIP pass
+    
+    Results are memoized per file content, view and product type, so reruns
+    and re-uploads of the same photo skip every check.
+    
+    Args:
+        files_bytes: Dict of {view_name: image bytes}
+        product_type: "Laptop" or "Mobile"
+        digests: Optional {view_name: content_digest} computed once per upload,
+            so reruns don't rehash the bytes
+    
+    Returns:
+        Dict of {view_name: (is_valid, reasons_list, info_dict)}
+    """
+    digests = digests or {}
+    keys = {
+        view: (digests.get(view) or content_digest(b), view, product_type)
+        for view, b in files_bytes.items()
+    }
+    results = {}
+    for view, key in keys.items():
+        hit = _store_get(key)
+        if hit is not None:
+            results[view] = hit
+    misses = [view for view in files_bytes if view not in results]
+
+    if misses:
+        pre = _validation_executor.map(lambda v: _prechecks(files_bytes[v], product_type), misses)
+        survivors = []
+        for view, (failure, clip_input, level, density) in zip(misses, pre):
+            if failure is not None:
+                results[view] = failure
+            else:
+                survivors.append((view, clip_input, level, density))
+
+        checks = clip_view_check_batch(
+            [clip_input for _, clip_input, _, _ in survivors],
+            [view for view, *_ in survivors],
+            prepared=True,
+        )
+        for (view, _, level, density), (v_ok, v_reasons, v_info) in zip(survivors, checks):
+            # The caller shows the borderline warning
+            v_info["blur_level"] = level
+            if v_ok:
+                v_info["edge_density"] = density
+            results[view] = (v_ok, v_reasons, v_info)
+
+        for view in misses:
+            _store_put(keys[view], results[view])
+
+    return {view: results[view] for view in files_bytes}
+
+def get_cached_validation(file_bytes, view_name, product_type, digest=None):
     """
     Cached validation combining all checks
     
@@ -100,34 +269,26 @@ def get_cached_validation(file_bytes, view_name, product_type):
         file_bytes: Image file as bytes
         view_name: Expected view name
         product_type: "Laptop" or "Mobile"
+        digest: Optional precomputed content_digest of file_bytes
     
     Returns:
         Tuple of (is_valid, reasons_list, info_dict)
     """
-    f = BytesIO(file_bytes)
-    
-    ok_res, w, h = validate_resolution(f, product_type)
-    if not ok_res:
-        return False, [f"Resolution too low: {w}x{h}"], {}
-    
-    is_blur, score, level = is_blurry(f, product_type)
+    return validate_all({view_name: file_bytes}, product_type, {view_name: digest})[view_name]
 
-    if is_blur:
-        return False, [f"Image too blurry ({level})"], {}
-
-    if level == "borderline":
-        st.warning(f"⚠️ Borderline sharpness — accepted")
-    
-    v_ok, v_reasons, v_info = clip_view_check(f, view_name)
-    if not v_ok:
-        return False, v_reasons, v_info
-        
-    return True, [], v_info
+def release_inspection_state():
+    """Drop uploaded images and analysis results when leaving a page, and free their memory"""
+    st.session_state.uploaded_files.clear()
+    st.session_state.analysis_results.clear()
+    release_memory()
 
 def get_file_bytes(file):
     """Helper to read file bytes"""
     if file is None: 
         return None
+    # UploadedFile is a BytesIO: take its buffer without moving the read position
+    if hasattr(file, "getvalue"):
+        return file.getvalue()
     file.seek(0)
     b = file.read()
     file.seek(0)